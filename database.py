@@ -1,14 +1,16 @@
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-
+import numpy as np
 import oracledb
 import os
-import array
 from dotenv import load_dotenv
 
 os.environ["USER_AGENT"] = "RAG-demo"
 
+# database credentials (read .env once at import)
+load_dotenv()
+_DSN  = os.getenv("DB_URL")
+_USER = os.getenv("DB_USER")
+_PASS = os.getenv("DB_PASS")
+
 from langchain_community.document_loaders import WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
@@ -24,21 +26,58 @@ columns_list    = "" # list of customer columns
 customer_name   = "" # get similar customers to this name
 distance_metric = "" # distance metric
 
+_schema_ready    = False # customer table created and loaded
+_vectorized_cols = None  # columns currently stored in profile vector
+
+_profile_cache   = None  # (names, fp32 profiles matrix, (precision, derived matrix) or None) for client-side search
+
+_pool            = None  # connection pool, created by init()
+
+_FETCH_ROWS      = 1000  # rows fetched per round-trip
+_STMT_CACHE      = 50    # statements cached per connection
+
+TILE_ROWS        = 1024  # rows per client-side distance tile (tune to L2 size / (4 * dims))
+
+# client-side storage type of cached profiles (distances always accumulate in float32)
+_PRECISIONS = {"fp32": np.float32, "fp16": np.float16}
+
+# metrics whose kernel casts fp16 tile by tile (others would upcast the whole matrix)
+_FP16_METRICS = frozenset({"EUCLIDEAN", "EUCLIDEAN_SQUARED"})
+
+METRICS = ("COSINE", "EUCLIDEAN", "EUCLIDEAN_SQUARED", "HAMMING", "MANHATTAN", "JACCARD", "DOT")
+
+_ALLOWED_COLS      = frozenset({"age", "income", "is_single", "no_children", "no_cars"})
+_ALLOWED_CUSTOMERS = frozenset({"Jessica", "David", "John", "Matthew", "Brandon", "Joshua", "Amanda", "Lauren", "James", "Olivia"})
+_ALLOWED_METRICS   = frozenset(METRICS)
+
+# similarity search sql per metric (fixed text, parsed once and cached)
+_SQL_BY_METRIC = {
+    m: f"""select name, profile 
+           from customer 
+           order by vector_distance(profile, (select profile from customer where name = :n), {m}) 
+           fetch first :k rows only"""
+    for m in METRICS
+}
+
+# all customers ranked by distance per metric (one pass feeds the whole chart)
+_RANKED_SQL_BY_METRIC = {
+    m: f"""select name, profile, 
+                  vector_distance(profile, (select profile from customer where name = :n), {m}) as distance 
+           from customer 
+           order by distance"""
+    for m in METRICS
+}
+
 # get database connection
 def get_connection():
-    load_dotenv()
-    dsn = os.getenv("DB_URL")
-    username = os.getenv("DB_USER")
-    password = os.getenv("DB_PASS")    
-
     try:
-        connection = oracledb.connect(user=username, password=password, dsn=dsn)        
+        connection = oracledb.connect(user=_USER, password=_PASS, dsn=_DSN, stmtcachesize=_STMT_CACHE)        
         return connection
     except Exception as e:
         print("Connection failed!")
  
 # create database schema        
-def create_schema():
+def create_schema(connection):
     with connection.cursor() as cursor:
         
         drop_table = "drop table if exists customer"
@@ -56,11 +95,11 @@ def create_schema():
                 cursor.execute(s)                
             except oracledb.DatabaseError as e:
                 raise                
-        insert_data()
+        insert_data(connection)
 
 # add job columns
 def add_job():
-    with connection.cursor() as cursor:   
+    with _pool.acquire() as connection, connection.cursor() as cursor:   
         drop_table = "drop table if exists customer"
         
         create_table = """create table customer (
@@ -78,6 +117,7 @@ def add_job():
                 cursor.execute(s)                
             except oracledb.DatabaseError as e:
                 raise 
+        reset() # customer table replaced, charts must rebuild it
              
         data_to_insert = [
             ("John",    28, 6700, "Engineer"),
@@ -102,13 +142,19 @@ def add_job():
         rs = cursor.fetchall()
         
         colunas = [col[0] for col in cursor.description]
-        df = pd.DataFrame(rs, columns=colunas)
-        print(df.to_string(index=False))        
+        print_table(colunas, rs)
+
 
 
+# print rows as a right-aligned text table
+def print_table(columns, rows):
+    widths = [max(len(str(v)) for v in [c] + [r[i] for r in rows]) for i, c in enumerate(columns)]
+    print(" ".join(str(c).rjust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print(" ".join(str(v).rjust(w) for v, w in zip(row, widths)))
 
-# insert sample data            
-def insert_data():    
+# insert sample data (caller commits)
+def insert_data(connection):    
     data_to_insert = [
         ("John",    28, 6700),
         ("Jessica", 22, 7000),
@@ -122,54 +168,45 @@ def insert_data():
         ("Olivia",  36, 5500) 
     ]
     
-    cursor = connection.cursor()
-    sql = "INSERT INTO customer (name, age, income) VALUES (:1, :2, :3)"
-    cursor.executemany(sql, data_to_insert)
-    connection.commit()    
+    with connection.cursor() as cursor:
+        cursor.setinputsizes(30, int, int)
+        sql = "INSERT INTO customer (name, age, income) VALUES (:1, :2, :3)"
+        cursor.executemany(sql, data_to_insert, batcherrors=False, arraydmlrowcounts=False)
    
-# vectorize data    
-def vectorize_data(column_list):
+# vectorize data (caller commits)
+def vectorize_data(connection, column_list):
     # add/remove vector column (modify vector column not supported)
     remove_vector_column = "alter table customer drop column profile"
     add_vector_column = "alter table customer add profile vector(" + str(len(column_list.split(","))) + ", float32)"    
-    cursor = connection.cursor()
-    try:   
-        cursor.execute(remove_vector_column)  # remove if exists
-        cursor.execute(add_vector_column)     # add if not exists           
-    except oracledb.DatabaseError as e:
-        cursor.execute(add_vector_column)     # remove throws error if not exists, then add
-    
-    # vectorize rows
     with connection.cursor() as cursor:
-        sql_query = "select id, " + column_list + " from customer"
-        cursor.execute(sql_query)       
-        query_resultset = cursor.fetchall()
-        
-        binds = []
-        for row in query_resultset:
-            id = row[0]
-            columns = row[1:]
-            profile_embedding = array.array('f', columns)     
-            binds.append((profile_embedding, id))                 
-        
-        sql_update = "update customer set profile = :1 where id = :2"
-        cursor.executemany(sql_update, binds)
-        connection.commit()        
+        try:   
+            cursor.execute(remove_vector_column)  # remove if exists
+            cursor.execute(add_vector_column)     # add if not exists           
+        except oracledb.DatabaseError as e:
+            cursor.execute(add_vector_column)     # remove throws error if not exists, then add
+    
+        # vectorize rows (server builds vectors in place, single statement)
+        concat_expr = "||','||".join(column_list.split(","))
+        sql_update = "update customer set profile = to_vector('[' || " + concat_expr + " || ']', " + str(len(column_list.split(","))) + ", float32)"
+        cursor.execute(sql_update)
 
 # get list of customers        
 def get_customers():
-    with connection.cursor() as cursor:
+    with _pool.acquire() as connection, connection.cursor() as cursor:
+        cursor.arraysize    = _FETCH_ROWS
+        cursor.prefetchrows = _FETCH_ROWS + 1
         sql = "select id, name, age, income from customer"
         cursor.execute(sql)   
         rs = cursor.fetchall()
         
         colunas = [col[0] for col in cursor.description]
-        df = pd.DataFrame(rs, columns=colunas)
-        print(df.to_string(index=False))        
+        print_table(colunas, rs)
 
 # get customer vectorized profiles 
 def get_customer_profiles():
-    with connection.cursor() as cursor:
+    with _pool.acquire() as connection, connection.cursor() as cursor:
+        cursor.arraysize    = _FETCH_ROWS
+        cursor.prefetchrows = _FETCH_ROWS + 1
         sql = "select name, profile from customer"
         cursor.execute(sql)   
         query_resultset = cursor.fetchall()
@@ -177,21 +214,80 @@ def get_customer_profiles():
    
 # perform similarity search (return topK=3)    
 def get_similiar_customer_profiles(column_list, name, k=3, distance="euclidean"):
-    with connection.cursor() as cursor:
-        sql = "select profile from customer where name = :1"
-        cursor.execute(sql, [name])   
-        embedding_profile = cursor.fetchone()
-        
-        sql = """select name, profile 
-                 from customer 
-                 order by vector_distance(profile, :1, distance_metric) fetch first :2 rows only"""
-                 
-        sql = sql.replace("distance_metric", distance)
-                
-        cursor.execute(sql, [embedding_profile[0], k])   
+    with _pool.acquire() as connection, connection.cursor() as cursor:
+        cursor.arraysize    = _FETCH_ROWS
+        cursor.prefetchrows = _FETCH_ROWS + 1
+        cursor.execute(_SQL_BY_METRIC[distance.upper()], dict(n=name, k=k))   
         similarity_resultset = cursor.fetchall()
         return similarity_resultset
 
+# get every customer profile ordered by distance to name
+def get_ranked_customer_profiles(name, distance="euclidean"):
+    with _pool.acquire() as connection, connection.cursor() as cursor:
+        cursor.arraysize    = _FETCH_ROWS
+        cursor.prefetchrows = _FETCH_ROWS + 1
+        cursor.execute(_RANKED_SQL_BY_METRIC[distance.upper()], dict(n=name))   
+        ranked_resultset = cursor.fetchall()
+        return ranked_resultset
+
+# squared euclidean distance computed W rows at a time (no full size temporary)
+def _euclid_batched(X, q, W):
+    out = np.empty(X.shape[0], np.float32)
+    for i in range(0, X.shape[0], W):
+        diff = np.subtract(X[i:i+W], q, dtype=np.float32)
+        out[i:i+W] = np.einsum('ij,ij->i', diff, diff)
+    return out
+
+# client-side distances of every profile row in X to q (smaller is closer)
+_LOCAL_DISTANCES = {
+    "EUCLIDEAN":         lambda X, q: np.sqrt(_euclid_batched(X, q, TILE_ROWS)),
+    "EUCLIDEAN_SQUARED": lambda X, q: _euclid_batched(X, q, TILE_ROWS),
+    "DOT":               lambda X, q: -(X @ q),
+    "COSINE":            lambda X, q: 1 - (X @ q) / (np.linalg.norm(X, axis=1) * np.linalg.norm(q)),
+    "MANHATTAN":         lambda X, q: np.abs(X - q).sum(1),
+}
+
+# load profiles once into a (N, d) fp32 matrix; other precisions derived from it (at most one kept)
+def get_profile_matrix(precision="fp32"):
+    global _profile_cache
+    if _profile_cache is None:
+        profiles = get_customer_profiles()
+        names = [p[0] for p in profiles]
+        # one bulk buffer conversion instead of one array per row
+        X = np.frombuffer(b"".join(p[1] for p in profiles), dtype=np.float32).reshape(len(profiles), -1)
+        _profile_cache = (names, X, None)
+        
+    names, X, derived = _profile_cache
+    if precision == "fp32":
+        return names, X
+    
+    if derived is None or derived[0] != precision:
+        derived = (precision, X.astype(_PRECISIONS[precision]))
+        _profile_cache = (names, X, derived)
+    return names, derived[1]
+
+# perform similarity search with numpy, no database round-trip (return topK=3)
+def get_similiar_customer_profiles_local(column_list, name, k=3, distance="euclidean", precision="fp32"):
+    distance = distance.upper()
+    if precision not in _PRECISIONS:
+        raise Exception("Precision must be one of fp32, fp16")
+    if precision != "fp32" and distance not in _FP16_METRICS:
+        raise Exception("fp16 precision supports only EUCLIDEAN and EUCLIDEAN_SQUARED")
+    if distance not in _LOCAL_DISTANCES:
+        return get_similiar_customer_profiles(column_list, name, k, distance)
+    
+    names, X = get_profile_matrix(precision)
+    q = X[names.index(name)].astype(np.float32)
+    d = _LOCAL_DISTANCES[distance](X, q)
+    
+    k = min(k, len(names))
+    top = np.argpartition(d, k - 1)[:k]
+    top = top[np.argsort(d[top])]
+    
+    # copies of the stored fp32 profiles, callers never hold cached data
+    _, X32 = get_profile_matrix()
+    return [(names[i], X32[i].copy()) for i in top]
+
 # set list of columns to compare 
 def set_column_list(columns):
     global columns_list
@@ -203,7 +299,7 @@ def set_column_list(columns):
         raise Exception("Specify 1 or 2 columns") 
           
     for item in col_list:
-        if item not in ["age", "income", "is_single", "no_children", "no_cars"]:
+        if item not in _ALLOWED_COLS:
             raise Exception("Column list should contain only age, inome, is_single, no_children or no_cars")
     
 # set customer name to get similarity        
@@ -211,42 +307,69 @@ def set_customer(name):
     global customer_name
     customer_name = name.title()
     
-    if customer_name.title() not in ["Jessica", "David", "John", "Matthew", "Brandon","Joshua", "Amanda", "Lauren", "James", "Olivia"]:
+    if customer_name not in _ALLOWED_CUSTOMERS:
         raise Exception("Customer name must be one of Jessica, David, Matthew, Brandon, Joshua, Amanda, Lauren, James, Olivia")
 
 # set similarity distance metric    
 def set_distance_metric(distance):
     global distance_metric
     distance_metric = distance.upper()
-    if distance_metric.upper() not in ["COSINE", "EUCLIDEAN", "EUCLIDEAN_SQUARED", "HAMMER", "MANHATTAN", "JACCARD", "DOT"]:
-        raise Exception("Distance must be one of CONSINE, EUCLIDEAN, EUCLIDEAN_SQUARE, MANHATTAN, JACCARD, DOT")
+    if distance_metric not in _ALLOWED_METRICS:
+        raise Exception("Distance must be one of COSINE, EUCLIDEAN, EUCLIDEAN_SQUARED, HAMMING, MANHATTAN, JACCARD, DOT")
     
+# forget cached schema state (next chart rebuilds table and vectors)
+def reset():
+    global _schema_ready, _vectorized_cols, _profile_cache
+    _schema_ready    = False
+    _vectorized_cols = None
+    _profile_cache   = None
+
+# create schema and vectorize only when needed, committing once
+def prepare_data():
+    global _schema_ready, _vectorized_cols, _profile_cache
+    if _schema_ready and _vectorized_cols == columns_list:
+        return
+    
+    with _pool.acquire() as connection:
+        try:
+            if not _schema_ready:
+                create_schema(connection)
+            vectorize_data(connection, columns_list)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    
+    _schema_ready    = True
+    _vectorized_cols = columns_list
+    _profile_cache   = None
+
 # get full chart
 def customers_chart(columns, distance="euclidean"):
+    import matplotlib.pyplot as plt # plotting libs loaded only when charting
+    
     set_column_list(columns)
     set_distance_metric(distance)
     
-    create_schema()    
-    vectorize_data(columns_list)
+    prepare_data()
     
-    all_profiles = get_customer_profiles()    
+    names, X = get_profile_matrix()
     
     cols = columns_list.split(",")
-    data = {
-        'Name':  [item[0] + '[' + str(int(item[1][0])) + ',' + str(int(item[1][1])) + ']'   for item in all_profiles],
-        cols[0]: [item[1][0] for item in all_profiles],
-        cols[1]: [item[1][1] for item in all_profiles]
-    }
+    xs, ys = X[:, 0].tolist(), X[:, 1].tolist()
+    names = [n + '[' + str(int(x)) + ',' + str(int(y)) + ']' for n, x, y in zip(names, xs, ys)]
     
     # Config chart
-    df = pd.DataFrame(data)
-    ax = sns.lineplot(data=df, x=cols[0], y=cols[1], hue='Name', marker='o')
+    ax = plt.gca()
+    ax.plot(xs, ys, 'o')
+    ax.set_xlabel(cols[0])
+    ax.set_ylabel(cols[1])
         
-    for i, row in df.iterrows():
+    for name, x, y in zip(names, xs, ys):
         ax.text(
-            row[cols[0]], 
-            row[cols[1]],
-            str(row['Name']),
+            x, 
+            y,
+            name,
             color='black',
             ha='left', 
             va='top', 
@@ -254,55 +377,64 @@ def customers_chart(columns, distance="euclidean"):
             fontweight='normal'
         )
     
-    # remove legend
-    plt.legend().remove()        
     return plt
 
 # get similarity chart    
 def similarity_chart(columns, cust_name, distance="euclidean"):
+    import matplotlib.pyplot as plt
+    
     set_column_list(columns)
     set_distance_metric(distance)
     set_customer(cust_name)
     
-    connection = get_connection()
-    create_schema()    
-    vectorize_data(columns_list)
-    
-    similiar_profiles = {s[0] for s in get_similiar_customer_profiles(columns_list, customer_name, 3, distance_metric)}
+    prepare_data()
     
-    all_profiles = get_customer_profiles()    
+    if distance_metric in _LOCAL_DISTANCES:
+        # top-k and chart points share the cached profile matrix (one fetch, none once warm)
+        similiar_profiles = {s[0] for s in get_similiar_customer_profiles_local(columns_list, customer_name, 3, distance_metric)}
+        names, X = get_profile_matrix()
+        xs, ys = X[:, 0].tolist(), X[:, 1].tolist()
+    else:
+        # no local kernel: one ranked query returns every point, nearest first (topK=3 is a slice)
+        ranked = get_ranked_customer_profiles(customer_name, distance_metric)
+        names, xs, ys = map(list, zip(*((r[0], r[1][0], r[1][1]) for r in ranked)))
+        similiar_profiles = set(names[:3])
     
     cols = columns_list.split(",")
-    data = {
-        'Name':  [item[0]    for item in all_profiles],
-        cols[0]: [item[1][0] for item in all_profiles],
-        cols[1]: [item[1][1] for item in all_profiles]
-    }
 
     # Config chart
-    df = pd.DataFrame(data)
-    ax = sns.lineplot(data=df, x=cols[0], y=cols[1], hue='Name', marker='o')
+    ax = plt.gca()
+    ax.plot(xs, ys, 'o')
+    ax.set_xlabel(cols[0])
+    ax.set_ylabel(cols[1])
         
-    for i, row in df.iterrows():
+    highlight = [name in similiar_profiles for name in names]
+        
+    for name, x, y, hi in zip(names, xs, ys, highlight):
         ax.text(
-            row[cols[0]], 
-            row[cols[1]],
-            str(row['Name']),
-            color='red'    if str(row['Name']) == customer_name else 'black',
+            x, 
+            y,
+            name,
+            color='red'    if name == customer_name else 'black',
             ha='left', 
             va='top', 
-            fontsize=10       if str(row['Name']) in similiar_profiles else 7,
-            fontweight='bold' if str(row['Name']) in similiar_profiles else 'normal'
+            fontsize=10       if hi else 7,
+            fontweight='bold' if hi else 'normal'
         )
     
-    
-    # Remove a legenda
-    plt.legend().remove()    
     return plt
 
+# create connection pool shared by all functions
 def init():
-    global connection
-    connection = get_connection()
+    global _pool
+    if _pool is not None:
+        _pool.close(force=True) # re-running init must not strand the previous pool's sessions
+        _pool = None
+    try:
+        _pool = oracledb.create_pool(user=_USER, password=_PASS, dsn=_DSN, min=1, max=4, increment=1, stmtcachesize=_STMT_CACHE)
+    except Exception as e:
+        print("Connection failed!")
+    reset()
     
 
     